@@ -1,12 +1,18 @@
 import logging
 import os
+import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
 from typing import List, Dict, Optional
 
 import dlt
-import requests
+import duckdb
+import orjson
+from requests.adapters import HTTPAdapter
+from requests_cache import EXPIRE_IMMEDIATELY, CachedSession
+from urllib3.util.retry import Retry
 
 logging.basicConfig(
     level=logging.INFO,
@@ -22,20 +28,32 @@ dlt_logger.setLevel(logging.WARNING)
 os.environ["DATA_WRITER__BUFFER_MAX_ITEMS"] = "50000"
 os.environ["DATA_WRITER__FILE_MAX_ITEMS"] = "10000"
 os.environ["NORMALIZE__WORKERS"] = str(max(2, os.cpu_count()))
-os.environ["EXTRACT__WORKERS"] = str(max(2, os.cpu_count() * 1))
+os.environ["NORMALIZE__START_METHOD"] = "spawn"
+os.environ["RUNTIME__DLTHUB_TELEMETRY"] = "false"
 
 BASE_URL = "https://jaffle-shop.scalevector.ai/api/v1"
 PAGE_SIZE = 100
-CHUNK_SIZE = 1000
 THREADS = 8
 BATCH_SIZE = 20
-FULL_REFRESH = False
+WINDOW_SIZE = 2 * BATCH_SIZE
+MAX_FAILED_PAGES = 3 * BATCH_SIZE
+LOADER_FILE_FORMAT = "parquet"
+RECORD_BATCH_SIZE = 1024
+HTTP_CACHE_NAME = os.environ.get("HTTP_CACHE_NAME", "http_cache")
+DUCKDB_PATH = "jaffle_shop_complete.duckdb"
+DUCKDB_CONFIG = {
+    "threads": os.cpu_count(),
+    "memory_limit": "4GB",
+    "preserve_insertion_order": False
+}
+DEV_MODE = False
 
 ENDPOINTS = {
     "orders": {
         "path": "/orders",
         "primary_key": "id",
-        "max_pages": 100
+        "max_pages": 100,
+        "money_columns": ["order_total"]
     },
     "customers": {
         "path": "/customers",
@@ -50,7 +68,8 @@ ENDPOINTS = {
     "supplies": {
         "path": "/supplies",
         "primary_key": "id",
-        "max_pages": 20
+        "max_pages": 20,
+        "money_columns": ["cost"]
     },
     "stores": {
         "path": "/stores",
@@ -59,116 +78,207 @@ ENDPOINTS = {
     }
 }
 
+os.environ["EXTRACT__WORKERS"] = str(len(ENDPOINTS))
+
+EXECUTOR = ThreadPoolExecutor(max_workers=THREADS * len(ENDPOINTS))
+
+ENDPOINT_LOGGERS = {endpoint: logging.getLogger(f'JaffleShop.{endpoint}') for endpoint in ENDPOINTS}
+ENDPOINT_URLS = {endpoint: BASE_URL + config["path"] for endpoint, config in ENDPOINTS.items()}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> CachedSession:
+    """Create the cached HTTP session on first use, so importing this module touches no files."""
+    global _session
+
+    with _session_lock:
+        if _session is None:
+            _session = CachedSession(
+                HTTP_CACHE_NAME,
+                backend="sqlite",
+                cache_control=True,
+                expire_after=EXPIRE_IMMEDIATELY
+            )
+            _session.mount(
+                "https://",
+                HTTPAdapter(
+                    pool_connections=THREADS,
+                    pool_maxsize=THREADS * len(ENDPOINTS),
+                    max_retries=Retry(
+                        total=3,
+                        backoff_factor=0.2,
+                        status_forcelist=[429, 500, 502, 503, 504]
+                    )
+                )
+            )
+        return _session
+
 
-def fetch_page(endpoint: str, page: int) -> List[Dict]:
-    endpoint_logger = logging.getLogger(f'JaffleShop.{endpoint}')
+def fetch_page(endpoint: str, page: int) -> Optional[List[Dict]]:
+    endpoint_logger = ENDPOINT_LOGGERS[endpoint]
 
     try:
-        url = f"{BASE_URL}{ENDPOINTS[endpoint]['path']}"
-        response = requests.get(
-            url,
+        response = get_session().get(
+            ENDPOINT_URLS[endpoint],
             params={"page": page, "per_page": PAGE_SIZE},
             timeout=10
         )
         response.raise_for_status()
-        data = response.json() or []
+        data = (orjson.loads(response.content) if response.content else None) or []
 
         if data:
-            endpoint_logger.debug(f"Page {page}: fetched {len(data)} records")
+            endpoint_logger.debug("Page %d: fetched %d records", page, len(data))
 
         return data
     except Exception as e:
         endpoint_logger.error(f"Error fetching page {page}: {e}")
-        return []
+        return None
 
 
-def create_resource(endpoint_name: str, max_pages: Optional[int] = None):
-    endpoint_logger = logging.getLogger(f'JaffleShop.{endpoint_name}')
+_duckdb_conn = None
 
-    @dlt.resource(
-        name=endpoint_name,
-        write_disposition="merge",
-        primary_key=ENDPOINTS[endpoint_name]["primary_key"]
-    )
-    def generic_resource(start_page: int = 1):
-        endpoint_max_pages = max_pages or ENDPOINTS[endpoint_name]["max_pages"]
 
-        with ThreadPoolExecutor(max_workers=THREADS) as executor:
-            chunk_buffer = []
-            current_page = start_page
-            empty_pages_count = 0
+def duckdb_destination():
+    """Reuse one DuckDB connection per process; dlt does not close connections handed to it."""
+    global _duckdb_conn
 
-            endpoint_logger.info(f"Starting extraction (pages {start_page} to {endpoint_max_pages})")
+    if _duckdb_conn is None:
+        _duckdb_conn = duckdb.connect(DUCKDB_PATH, config=DUCKDB_CONFIG)
+    return dlt.destinations.duckdb(_duckdb_conn)
 
-            while current_page <= endpoint_max_pages and empty_pages_count < 3:
-                batch_end = min(current_page + BATCH_SIZE, endpoint_max_pages + 1)
-                batch_pages = list(range(current_page, batch_end))
 
-                endpoint_logger.info(f"Processing batch: pages {current_page}-{batch_end - 1}")
+def close_duckdb_connection():
+    global _duckdb_conn
 
-                page_futures = {
-                    executor.submit(fetch_page, endpoint_name, page): page
-                    for page in batch_pages
-                }
+    if _duckdb_conn is not None:
+        _duckdb_conn.close()
+        _duckdb_conn = None
 
-                batch_empty = True
-                for future in as_completed(page_futures):
-                    page_num = page_futures[future]
-                    page_data = future.result()
 
-                    if page_data:
-                        endpoint_logger.debug(f"Page {page_num}: {len(page_data)} records")
-                        chunk_buffer.extend(page_data)
-                        batch_empty = False
-                        empty_pages_count = 0
+def parse_money(value) -> Optional[Decimal]:
+    if value is None:
+        return None
+    try:
+        return Decimal(str(value).replace("$", "").replace(",", "").strip())
+    except InvalidOperation:
+        return None
+
+
+def add_numeric_money_columns(record: Dict, columns: List[str]) -> Dict:
+    for column in columns:
+        record[f"{column}_num"] = parse_money(record.get(column))
+    return record
 
-                        if len(chunk_buffer) >= CHUNK_SIZE:
-                            endpoint_logger.info(f"Yielding chunk of {len(chunk_buffer)} records")
-                            yield chunk_buffer
-                            chunk_buffer = []
-                    else:
-                        endpoint_logger.debug(f"Page {page_num}: empty")
 
-                if batch_empty:
-                    empty_pages_count += 1
-                    endpoint_logger.debug(f"Empty batch detected, count: {empty_pages_count}")
+def make_money_mapper(columns: List[str]):
+    return lambda record: add_numeric_money_columns(record, columns)
 
-                current_page = batch_end
 
-            if chunk_buffer:
-                endpoint_logger.info(f"Yielding final chunk: {len(chunk_buffer)} records")
-                yield chunk_buffer
+def create_resource(endpoint_name: str, max_pages: Optional[int] = None):
+    endpoint_logger = ENDPOINT_LOGGERS[endpoint_name]
 
-            endpoint_logger.info(f"Extraction completed!")
+    @dlt.resource(
+        name=endpoint_name,
+        write_disposition="merge",
+        primary_key=ENDPOINTS[endpoint_name]["primary_key"],
+        parallelized=True
+    )
+    def generic_resource(start_page: int = 1):
+        endpoint_max_pages = max_pages or ENDPOINTS[endpoint_name]["max_pages"]
+        resource_state = dlt.current.resource_state(endpoint_name)
+
+        page_futures = {}
+        window_size = THREADS
+        next_page = max(start_page, resource_state.get("last_page", 0))
+        contiguous_page = next_page - 1
+        finished_pages = {}
+        last_page = endpoint_max_pages
+        failed_pages_count = 0
+
+        endpoint_logger.info(f"Starting extraction (pages {next_page} to {endpoint_max_pages})")
+
+        while page_futures or next_page <= last_page:
+            while next_page <= last_page and len(page_futures) < window_size:
+                page_futures[EXECUTOR.submit(fetch_page, endpoint_name, next_page)] = next_page
+                next_page += 1
+
+            done, _ = wait(page_futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                page_num = page_futures.pop(future)
+                page_data = future.result()
+
+                if page_data is None:
+                    failed_pages_count += 1
+                    endpoint_logger.debug("Page %d: failed, count: %d", page_num, failed_pages_count)
+                    continue
+
+                endpoint_logger.debug("Page %d: %d records", page_num, len(page_data))
+                failed_pages_count = 0
+
+                if len(page_data) < PAGE_SIZE:
+                    if page_num < last_page:
+                        endpoint_logger.info(f"Short page {page_num} received, no more pages to fetch")
+                        last_page = page_num
+                else:
+                    window_size = min(window_size + 1, WINDOW_SIZE)
+
+                finished_pages[page_num] = bool(page_data)
+                while contiguous_page + 1 in finished_pages:
+                    contiguous_page += 1
+                    if finished_pages.pop(contiguous_page):
+                        resource_state["last_page"] = contiguous_page
+
+                if page_data:
+                    yield page_data
+
+            if failed_pages_count >= MAX_FAILED_PAGES and next_page <= last_page:
+                endpoint_logger.info(f"{failed_pages_count} failed pages in a row, no more pages to fetch")
+                last_page = next_page - 1
+
+            for future, page_num in list(page_futures.items()):
+                if page_num > last_page and future.cancel():
+                    del page_futures[future]
+
+        endpoint_logger.info(f"Extraction completed!")
 
     return generic_resource
 
 
+@dlt.source(name="jaffle_shop")
+def jaffle_shop_source():
+    resources = []
+    for endpoint in ENDPOINTS.keys():
+        resource = create_resource(endpoint)()
+        money_columns = ENDPOINTS[endpoint].get("money_columns")
+        if money_columns:
+            resource.add_map(make_money_mapper(money_columns))
+        resources.append(resource)
+
+    return resources
+
+
 def run_complete_pipeline():
     logger.info("=" * 60)
     logger.info("JAFFLE SHOP COMPLETE PIPELINE")
     logger.info("=" * 60)
     logger.info(f"System: {os.cpu_count()} CPU cores")
-    logger.info(f"Config: {THREADS} threads, {CHUNK_SIZE} chunk size")
+    logger.info(f"Config: {THREADS} threads, {THREADS}-{WINDOW_SIZE} pages in flight, {LOADER_FILE_FORMAT} files")
     logger.info(f"Endpoints: {', '.join(ENDPOINTS.keys())}")
 
     pipeline = dlt.pipeline(
         pipeline_name="jaffle_shop_complete",
-        destination="duckdb",
+        destination=duckdb_destination(),
         dataset_name="jaffle_shop",
-        full_refresh=FULL_REFRESH,
+        dev_mode=DEV_MODE,
     )
 
     start_time = time.time()
 
     try:
-        resources = []
-        for endpoint in ENDPOINTS.keys():
-            resource = create_resource(endpoint)
-            resources.append(resource())
-
         logger.info("Running extraction for all endpoints...")
-        load_info = pipeline.run(resources)
+        load_info = pipeline.run(jaffle_shop_source(), loader_file_format=LOADER_FILE_FORMAT)
 
         end_time = time.time()
         duration = end_time - start_time
@@ -178,6 +288,7 @@ def run_complete_pipeline():
         logger.info(f"Duration: {duration:.2f} seconds")
         logger.debug(f"Load info: {load_info}")
 
+        build_items_enriched(pipeline)
         show_pipeline_stats(pipeline, duration)
 
         return pipeline
@@ -187,6 +298,28 @@ def run_complete_pipeline():
         raise
 
 
+def build_items_enriched(pipeline):
+    enrich_logger = logging.getLogger('JaffleShop.Enrich')
+
+    try:
+        with pipeline.sql_client() as client:
+            client.execute_sql("""
+                               CREATE OR REPLACE TABLE items_enriched AS
+                               SELECT i.id,
+                                      i.order_id,
+                                      i.sku,
+                                      o.customer_id,
+                                      o.store_id,
+                                      o.order_total_num
+                               FROM items i
+                                        JOIN orders o ON i.order_id = o.id
+                               """)
+            enrich_logger.info("Built items_enriched table for analysis")
+
+    except Exception as e:
+        enrich_logger.error(f"Could not build items_enriched table: {e}")
+
+
 def show_pipeline_stats(pipeline, duration):
     stats_logger = logging.getLogger('JaffleShop.Stats')
 
@@ -197,16 +330,20 @@ def show_pipeline_stats(pipeline, duration):
 
             total_records = 0
 
+            loaded_tables = pipeline.default_schema.tables
             for endpoint in ENDPOINTS.keys():
-                try:
-                    result = client.execute_sql(f"SELECT COUNT(*) as count FROM {endpoint}")
-                    rows = list(result)
-                    if rows:
-                        count = rows[0][0]
-                        total_records += count
-                        stats_logger.info(f"{endpoint.capitalize()}: {count:,} records")
-                except Exception as e:
-                    stats_logger.warning(f"Could not get stats for {endpoint}: {e}")
+                if endpoint not in loaded_tables:
+                    stats_logger.warning(f"Could not get stats for {endpoint}: table was not loaded")
+
+            count_query = " UNION ALL ".join(
+                f"SELECT '{endpoint}' AS name, COUNT(*) AS count FROM {endpoint}"
+                for endpoint in ENDPOINTS.keys()
+                if endpoint in loaded_tables
+            )
+            if count_query:
+                for endpoint, count in client.execute_sql(count_query):
+                    total_records += count
+                    stats_logger.info(f"{endpoint.capitalize()}: {count:,} records")
 
             stats_logger.info(f"Total records: {total_records:,}")
             if duration > 0:
@@ -216,33 +353,26 @@ def show_pipeline_stats(pipeline, duration):
         stats_logger.error(f"Could not get statistics: {e}")
 
 
-def analyze_most_purchased_product():
+def analyze_most_purchased_product(pipeline):
     analysis_logger = logging.getLogger('JaffleShop.Analysis')
 
     analysis_logger.info("=" * 60)
     analysis_logger.info("ANALYZING MOST PURCHASED PRODUCT")
     analysis_logger.info("=" * 60)
 
-    pipeline = dlt.pipeline(
-        pipeline_name="jaffle_shop_complete",
-        destination="duckdb",
-        dataset_name="jaffle_shop"
-    )
-
     try:
         with pipeline.sql_client() as client:
             query = """
-                    WITH product_sales AS (SELECT i.sku, \
-                                                  COUNT(*)                                                                       as total_sales, \
-                                                  COUNT(DISTINCT o.customer_id)                                                  as unique_customers, \
-                                                  COUNT(DISTINCT o.store_id)                                                     as stores_sold_in, \
-                                                  SUM(CAST(REPLACE(REPLACE(o.order_total, '$', ''), ',', '') AS DECIMAL(10, 2))) as total_revenue \
-                                           FROM items i \
-                                                    JOIN orders o ON i.order_id = o.id \
-                                           GROUP BY i.sku),
+                    WITH product_sales AS (SELECT sku, \
+                                                  COUNT(*)                    as total_sales, \
+                                                  COUNT(DISTINCT customer_id) as unique_customers, \
+                                                  COUNT(DISTINCT store_id)    as stores_sold_in, \
+                                                  SUM(order_total_num)        as total_revenue \
+                                           FROM items_enriched \
+                                           GROUP BY sku),
                          product_info AS (SELECT ps.*, \
-                                                 s.name                                                             as product_name, \
-                                                 CAST(REPLACE(REPLACE(s.cost, '$', ''), ',', '') AS DECIMAL(10, 2)) as supply_cost \
+                                                 s.name     as product_name, \
+                                                 s.cost_num as supply_cost \
                                           FROM product_sales ps \
                                                    LEFT JOIN supplies s ON ps.sku = s.sku)
                     SELECT COALESCE(product_name, sku)                                          as product, \
@@ -260,9 +390,10 @@ def analyze_most_purchased_product():
                     ORDER BY total_sales DESC LIMIT 20 \
                     """
 
+            connection = client.native_connection
+
             analysis_logger.debug("Executing main product analysis query...")
-            result = client.execute_sql(query)
-            rows = list(result)
+            rows = connection.execute(query).fetch_arrow_table().to_pylist()
 
             if rows:
                 analysis_logger.info("\nTOP 20 MOST PURCHASED PRODUCTS:")
@@ -272,61 +403,60 @@ def analyze_most_purchased_product():
                 analysis_logger.info(header)
                 analysis_logger.info("-" * 140)
 
-                for row in rows:
-                    product = row[0] if row[0] else "Unknown"
-                    sku = row[1]
-                    sales = row[2]
-                    customers = row[3]
-                    revenue = row[5] if row[5] else 0
-                    cost = row[7] if row[7] else 0
-                    profit = row[8] if row[8] else 0
-                    margin = row[9] if row[9] else 0
-
-                    analysis_logger.info(
-                        f"{product:<30} {sku:<10} {sales:<8} {customers:<10} ${revenue:<11,.2f} ${cost:<9.2f} ${profit:<11,.2f} {margin:<9.1f}%"
-                    )
+                if analysis_logger.isEnabledFor(logging.INFO):
+                    for row in rows:
+                        product = row["product"] if row["product"] else "Unknown"
+                        sku = row["sku"]
+                        sales = row["total_sales"]
+                        customers = row["unique_customers"]
+                        revenue = row["total_revenue"] if row["total_revenue"] else 0
+                        cost = row["supply_cost"] if row["supply_cost"] else 0
+                        profit = row["gross_profit"] if row["gross_profit"] else 0
+                        margin = row["gross_margin_pct"] if row["gross_margin_pct"] else 0
+
+                        analysis_logger.info(
+                            f"{product:<30} {sku:<10} {sales:<8} {customers:<10} ${revenue:<11,.2f} ${cost:<9.2f} ${profit:<11,.2f} {margin:<9.1f}%"
+                        )
 
                 if rows:
                     winner = rows[0]
                     analysis_logger.info("\n" + "=" * 60)
                     analysis_logger.info("🥇 MOST PURCHASED PRODUCT:")
                     analysis_logger.info("=" * 60)
-                    analysis_logger.info(f"Product: {winner[0] if winner[0] else 'SKU: ' + winner[1]}")
-                    analysis_logger.info(f"SKU: {winner[1]}")
-                    analysis_logger.info(f"Total Sales: {winner[2]:,}")
-                    analysis_logger.info(f"Unique Customers: {winner[3]:,}")
-                    analysis_logger.info(f"Sold in {winner[4]} stores")
-                    analysis_logger.info(f"Total Revenue: ${winner[5]:,.2f}")
-                    analysis_logger.info(f"Average Revenue per Sale: ${winner[6]:.2f}")
-                    if winner[7]:
-                        analysis_logger.info(f"Unit Cost: ${winner[7]:.2f}")
-                        analysis_logger.info(f"Total Gross Profit: ${winner[8]:,.2f}")
-                        analysis_logger.info(f"Profit Margin: {winner[9]:.1f}%")
+                    analysis_logger.info(f"Product: {winner['product'] if winner['product'] else 'SKU: ' + winner['sku']}")
+                    analysis_logger.info(f"SKU: {winner['sku']}")
+                    analysis_logger.info(f"Total Sales: {winner['total_sales']:,}")
+                    analysis_logger.info(f"Unique Customers: {winner['unique_customers']:,}")
+                    analysis_logger.info(f"Sold in {winner['stores_sold_in']} stores")
+                    analysis_logger.info(f"Total Revenue: ${winner['total_revenue']:,.2f}")
+                    analysis_logger.info(f"Average Revenue per Sale: ${winner['avg_revenue_per_sale']:.2f}")
+                    if winner['supply_cost']:
+                        analysis_logger.info(f"Unit Cost: ${winner['supply_cost']:.2f}")
+                        analysis_logger.info(f"Total Gross Profit: ${winner['gross_profit']:,.2f}")
+                        analysis_logger.info(f"Profit Margin: {winner['gross_margin_pct']:.1f}%")
 
                 analysis_logger.info("\nANALYSIS BY CATEGORY:")
-                result = client.execute_sql("""
+                categories = connection.execute("""
                                             SELECT SUBSTR(sku, 1, 3)   as category,
                                                    COUNT(DISTINCT sku) as unique_products,
                                                    SUM(total_sales)    as total_category_sales,
                                                    SUM(total_revenue)  as total_category_revenue
-                                            FROM (SELECT i.sku,
-                                                         COUNT(*)                                                                       as total_sales,
-                                                         SUM(CAST(REPLACE(REPLACE(o.order_total, '$', ''), ',', '') AS DECIMAL(10, 2))) as total_revenue
-                                                  FROM items i
-                                                           JOIN orders o ON i.order_id = o.id
-                                                  GROUP BY i.sku) sku_sales
+                                            FROM (SELECT sku,
+                                                         COUNT(*)             as total_sales,
+                                                         SUM(order_total_num) as total_revenue
+                                                  FROM items_enriched
+                                                  GROUP BY sku) sku_sales
                                             GROUP BY SUBSTR(sku, 1, 3)
                                             ORDER BY total_category_sales DESC
-                                            """)
+                                            """).fetch_record_batch(RECORD_BATCH_SIZE)
 
-                rows = list(result)
-                if rows:
-                    analysis_logger.info("-" * 80)
-                    analysis_logger.info(f"{'Category':<15} {'Products':<15} {'Total Sales':<15} {'Total Revenue':<20}")
-                    analysis_logger.info("-" * 80)
-                    for row in rows:
-                        cat, prods, sales, revenue = row
-                        analysis_logger.info(f"{cat:<15} {prods:<15} {sales:<15,} ${revenue:<19,.2f}")
+                analysis_logger.info("-" * 80)
+                analysis_logger.info(f"{'Category':<15} {'Products':<15} {'Total Sales':<15} {'Total Revenue':<20}")
+                analysis_logger.info("-" * 80)
+                if analysis_logger.isEnabledFor(logging.INFO):
+                    for batch in categories:
+                        for cat, prods, sales, revenue in zip(*batch.to_pydict().values()):
+                            analysis_logger.info(f"{cat:<15} {prods:<15} {sales:<15,} ${revenue:<19,.2f}")
 
             else:
                 analysis_logger.warning("No data found. Make sure the pipeline has run successfully.")
@@ -335,7 +465,7 @@ def analyze_most_purchased_product():
         analysis_logger.error(f"Analysis failed: {e}", exc_info=True)
         try:
             with pipeline.sql_client() as client:
-                result = client.execute_sql("""
+                rows = client.execute_sql("""
                                             SELECT sku, COUNT(*) as count
                                             FROM items
                                             GROUP BY sku
@@ -343,42 +473,35 @@ def analyze_most_purchased_product():
                                                 LIMIT 10
                                             """)
 
-                rows = list(result)
                 if rows:
                     analysis_logger.info("\nSIMPLE COUNT BY SKU:")
                     analysis_logger.info("-" * 40)
-                    for i, row in enumerate(rows, 1):
-                        analysis_logger.info(f"{i}. SKU {row[0]}: {row[1]:,} sales")
+                    if analysis_logger.isEnabledFor(logging.INFO):
+                        for i, row in enumerate(rows, 1):
+                            analysis_logger.info(f"{i}. SKU {row[0]}: {row[1]:,} sales")
 
         except Exception as fallback_e:
             analysis_logger.error(f"Fallback query also failed: {fallback_e}")
 
 
-def run_supply_chain_analysis():
+def run_supply_chain_analysis(pipeline):
     supply_logger = logging.getLogger('JaffleShop.SupplyChain')
 
     supply_logger.info("=" * 50)
     supply_logger.info("SUPPLY CHAIN ANALYSIS")
     supply_logger.info("=" * 50)
 
-    pipeline = dlt.pipeline(
-        pipeline_name="jaffle_shop_complete",
-        destination="duckdb",
-        dataset_name="jaffle_shop"
-    )
-
     try:
         with pipeline.sql_client() as client:
             query = """
-                    WITH sku_performance AS (SELECT i.sku, \
-                                                    COUNT(*)                      as units_sold, \
-                                                    COUNT(DISTINCT o.customer_id) as unique_customers \
-                                             FROM items i \
-                                                      JOIN orders o ON i.order_id = o.id \
-                                             GROUP BY i.sku),
+                    WITH sku_performance AS (SELECT sku, \
+                                                    COUNT(*)                    as units_sold, \
+                                                    COUNT(DISTINCT customer_id) as unique_customers \
+                                             FROM items_enriched \
+                                             GROUP BY sku),
                          supply_analysis AS (SELECT s.name                           as supply_name, \
                                                     s.sku, \
-                                                    s.cost, \
+                                                    s.cost_num, \
                                                     s.perishable, \
                                                     COALESCE(sp.units_sold, 0)       as units_sold, \
                                                     COALESCE(sp.unique_customers, 0) as customers_reached \
@@ -386,17 +509,16 @@ def run_supply_chain_analysis():
                                                       LEFT JOIN sku_performance sp ON s.sku = sp.sku)
                     SELECT supply_name, \
                            sku, \
-                           CAST(REPLACE(cost, '$', '') AS DECIMAL(10, 2))                        as unit_cost, \
+                           cost_num                          as unit_cost, \
                            perishable, \
                            units_sold, \
                            customers_reached, \
-                           ROUND(units_sold * CAST(REPLACE(cost, '$', '') AS DECIMAL(10, 2)), 2) as total_cost
+                           ROUND(units_sold * cost_num, 2)   as total_cost
                     FROM supply_analysis
                     ORDER BY units_sold DESC LIMIT 15 \
                     """
 
-            result = client.execute_sql(query)
-            rows = list(result)
+            rows = client.native_connection.execute(query).fetch_arrow_table().to_pylist()
 
             if rows:
                 supply_logger.info("\nSUPPLY CHAIN PERFORMANCE:")
@@ -407,10 +529,11 @@ def run_supply_chain_analysis():
                 supply_logger.info("-" * 100)
 
                 for row in rows:
-                    name, sku, cost, perishable, units, customers, total = row
+                    name, sku, cost, perishable, units, customers, total = row.values()
+                    cost = cost if cost else 0
                     perish = "Yes" if perishable else "No"
                     supply_logger.info(
-                        f"{name:<30} {sku:<15} ${cost:<9.2f} {perish:<12} {units:<12} {customers:<12}"
+                        "%-30s %-15s $%-9.2f %-12s %-12s %-12s", name, sku, cost, perish, units, customers
                     )
 
     except Exception as e:
@@ -448,8 +571,8 @@ if __name__ == "__main__":
         pipeline = run_complete_pipeline()
         logger.info("\nSUCCESS! Complete pipeline finished.")
 
-        analyze_most_purchased_product()
-        run_supply_chain_analysis()
+        analyze_most_purchased_product(pipeline)
+        run_supply_chain_analysis(pipeline)
 
         logger.info("\nPIPELINE COMPLETED SUCCESSFULLY!")
         logger.info("All data has been loaded and analyzed.")
@@ -457,3 +580,5 @@ if __name__ == "__main__":
     except Exception as e:
         logger.error(f"\nPipeline failed with error: {e}", exc_info=True)
         logger.error("Check the error messages above for details.")
+    finally:
+        close_duckdb_connection()
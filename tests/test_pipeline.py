@@ -0,0 +1,170 @@
+import os
+import subprocess
+import sys
+from decimal import Decimal
+from pathlib import Path
+
+import dlt
+import duckdb
+import orjson
+import pytest
+
+import main
+
+RECORDS = {
+    "orders": [
+        {"id": f"o{i}", "customer_id": f"c{i % 7}", "store_id": f"s{i % 3}", "order_total": "$1,234.50"}
+        for i in range(250)
+    ],
+    "customers": [{"id": f"c{i}", "name": f"Customer {i}"} for i in range(150)],
+    "items": [{"id": f"i{i}", "order_id": f"o{i % 250}", "sku": f"JAF-00{i % 4}"} for i in range(320)],
+    "supplies": [
+        {"id": f"su{i}", "name": f"Supply {i}", "sku": f"JAF-00{i}", "cost": "$0.50", "perishable": i % 2 == 0}
+        for i in range(4)
+    ] + [{"id": "su4", "name": "Supply 4", "sku": "BEV-001", "cost": "", "perishable": False}],
+    "stores": [{"id": f"s{i}", "name": f"Store {i}"} for i in range(3)],
+}
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.content = orjson.dumps(payload)
+
+    def raise_for_status(self):
+        pass
+
+
+@pytest.fixture
+def fake_api(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "HTTP_CACHE_NAME", str(tmp_path / "http_cache"))
+    monkeypatch.setattr(main, "_session", None)
+    calls = {endpoint: [] for endpoint in main.ENDPOINTS}
+    endpoints_by_url = {url: endpoint for endpoint, url in main.ENDPOINT_URLS.items()}
+
+    def fake_get(url, params, timeout):
+        endpoint = endpoints_by_url[url]
+        page = params["page"]
+        calls[endpoint].append(page)
+        start = (page - 1) * params["per_page"]
+        return FakeResponse(RECORDS[endpoint][start:start + params["per_page"]])
+
+    monkeypatch.setattr(main.get_session(), "get", fake_get)
+    return calls
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    return dlt.pipeline(
+        pipeline_name="jaffle_shop_test",
+        destination=dlt.destinations.duckdb(str(tmp_path / "jaffle_shop_test.duckdb")),
+        dataset_name="jaffle_shop",
+        pipelines_dir=str(tmp_path / "pipelines"),
+    )
+
+
+def test_import_creates_no_http_cache(tmp_path):
+    env = {**os.environ, "PYTHONPATH": str(Path(main.__file__).parent)}
+    subprocess.run([sys.executable, "-c", "import main"], cwd=tmp_path, env=env, check=True)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_parse_money():
+    assert main.parse_money("$1,234.50") == Decimal("1234.50")
+    assert main.parse_money(None) is None
+    assert main.parse_money("") is None
+    assert main.parse_money("n/a") is None
+
+
+def test_source_loads_all_endpoints(fake_api, pipeline):
+    pipeline.run(main.jaffle_shop_source(), loader_file_format=main.LOADER_FILE_FORMAT)
+    main.build_items_enriched(pipeline)
+
+    with pipeline.sql_client() as client:
+        for endpoint, records in RECORDS.items():
+            assert client.execute_sql(f"SELECT COUNT(*) FROM {endpoint}")[0][0] == len(records)
+
+        assert client.execute_sql("SELECT DISTINCT order_total_num FROM orders") == [(Decimal("1234.50"),)]
+        assert client.execute_sql("SELECT cost_num FROM supplies WHERE id = 'su4'") == [(None,)]
+        assert client.execute_sql("SELECT COUNT(*), SUM(order_total_num) FROM items_enriched") == [
+            (320, Decimal("395040.00"))
+        ]
+
+
+def test_short_pages_and_resume_limit_requests(fake_api, pipeline):
+    pages = {endpoint: -(-len(records) // main.PAGE_SIZE) for endpoint, records in RECORDS.items()}
+
+    pipeline.run(main.jaffle_shop_source(), loader_file_format=main.LOADER_FILE_FORMAT)
+    for endpoint, calls in fake_api.items():
+        # each full page frees a slot and widens the window by one
+        assert len(calls) <= main.THREADS + 2 * (pages[endpoint] - 1)
+
+    for calls in fake_api.values():
+        calls.clear()
+    pipeline.run(main.jaffle_shop_source(), loader_file_format=main.LOADER_FILE_FORMAT)
+    for endpoint, calls in fake_api.items():
+        assert min(calls) == pages[endpoint]
+        assert len(calls) <= main.THREADS
+
+    with pipeline.sql_client() as client:
+        assert client.execute_sql("SELECT COUNT(*) FROM orders")[0][0] == len(RECORDS["orders"])
+
+
+def test_failed_page_is_fetched_again_on_next_run(fake_api, pipeline, monkeypatch):
+    session = main.get_session()
+    fake_get = session.get
+
+    def failing_get(url, params, timeout):
+        if url == main.ENDPOINT_URLS["orders"] and params["page"] == 1:
+            raise RuntimeError("connection reset")
+        return fake_get(url, params, timeout)
+
+    monkeypatch.setattr(session, "get", failing_get)
+    pipeline.run(main.jaffle_shop_source(), loader_file_format=main.LOADER_FILE_FORMAT)
+    with pipeline.sql_client() as client:
+        assert client.execute_sql("SELECT COUNT(*) FROM orders")[0][0] == len(RECORDS["orders"]) - main.PAGE_SIZE
+
+    monkeypatch.setattr(session, "get", fake_get)
+    fake_api["orders"].clear()
+    pipeline.run(main.jaffle_shop_source(), loader_file_format=main.LOADER_FILE_FORMAT)
+    assert min(fake_api["orders"]) == 1
+    with pipeline.sql_client() as client:
+        assert client.execute_sql("SELECT COUNT(*) FROM orders")[0][0] == len(RECORDS["orders"])
+
+
+def test_empty_page_ends_pagination(fake_api, pipeline, monkeypatch):
+    monkeypatch.setitem(RECORDS, "items", RECORDS["items"][:3 * main.PAGE_SIZE])
+
+    pipeline.run(main.jaffle_shop_source(), loader_file_format=main.LOADER_FILE_FORMAT)
+
+    assert len(fake_api["items"]) <= main.THREADS + 2 * 3
+    with pipeline.sql_client() as client:
+        assert client.execute_sql("SELECT COUNT(*) FROM items")[0][0] == 3 * main.PAGE_SIZE
+
+
+def test_analyses_log_rows_with_missing_cost(fake_api, pipeline, caplog, capsys):
+    pipeline.run(main.jaffle_shop_source(), loader_file_format=main.LOADER_FILE_FORMAT)
+    main.build_items_enriched(pipeline)
+
+    with caplog.at_level("INFO", logger="JaffleShop"):
+        main.analyze_most_purchased_product(pipeline)
+        main.run_supply_chain_analysis(pipeline)
+
+    assert "--- Logging error ---" not in capsys.readouterr().err
+    assert not [record for record in caplog.records if record.levelname == "ERROR"]
+    assert any(record.getMessage().startswith("Supply 4 ") for record in caplog.records)
+
+
+def test_duckdb_connection_is_reused_and_closed(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "DUCKDB_PATH", str(tmp_path / "jaffle_shop.duckdb"))
+    monkeypatch.setattr(main, "_duckdb_conn", None)
+
+    main.duckdb_destination()
+    conn = main._duckdb_conn
+    main.duckdb_destination()
+    assert main._duckdb_conn is conn
+
+    main.close_duckdb_connection()
+    assert main._duckdb_conn is None
+    with pytest.raises(duckdb.ConnectionException):
+        conn.execute("SELECT 1")